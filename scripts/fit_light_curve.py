@@ -5,56 +5,53 @@ from scipy.signal import argrelextrema
 from scipy import interpolate
 import matplotlib.pyplot as plt
 
+from .magnitudes import parse_header
 
-class LightCurve(object):
-    def __init__(self, filename, bin_size=1, interpKind='slinear'):
-        self.filename = filename
-        self.snVars, self.data = self.get_data()
-        self.bin_size = bin_size
-        self.interpKind = interpKind
 
-    def get_data(self):
-        """
-        Retrieves the header variables and the light curve data from a supernova data file.
-        
-        Returns
-        -------
-        fileVars : dict
-            File variables from the header of the input self.filename
-        data : DataFrame
-            The data for each epoch with data from the input self.filename
-        
-        """
-        with open(self.filename, 'r') as FileObj:
-            lines = FileObj.readlines()
-
-        snName = lines[0].split()[1]
-        fileVars = {'snName': snName}
-        for line in lines[:10]:
-            if line[0] != '#':
-                valuesStr, keysStr = line.split(' # ')
-                keys = keysStr.replace('(', '', 1).rsplit(')', 1)[0].split(', ')
-                values = valuesStr.split()
-                for i in range(len(keys)):
-                    fileVars[keys[i]] = values[i]
-
-        header = lines[11].split('|')
-        columnNames = [col.strip('#').strip() for col in header]
+def read_header(filename):
+    """
+    Retrieves the header variables and the column names from a supernova data file.
 
-        data = pd.read_csv(self.filename, header=None, delim_whitespace=True, skiprows=12, names=columnNames,
-                           comment='#')
+    Returns
+    -------
+    fileVars : dict
+        File variables from the header of the input filename
+    columnNames : list
+        Names of the data columns
+
+    """
+    with open(filename, 'r') as FileObj:
+        lines = [FileObj.readline() for _ in range(12)]
+
+    snName = lines[0].split()[1]
+    fileVars = {'snName': snName}
+    for line in lines[:10]:
+        if line[0] != '#':
+            valuesStr, keysStr = line.split(' # ')
+            keys = keysStr.replace('(', '', 1).rsplit(')', 1)[0].split(', ')
+            values = valuesStr.split()
+            for i in range(len(keys)):
+                fileVars[keys[i]] = values[i]
+
+    header = lines[11].split('|')
+    columnNames = [col.strip('#').strip() for col in header]
+
+    return fileVars, columnNames
 
-        return fileVars, data
+
+class _BaseLightCurve(object):
+    """ Binning, peak finding and plotting shared by LightCurve and CompactLightCurve.
+    Subclasses provide the phase, absMag and absMagErr arrays and the bin_size and interpKind attributes. """
+    __slots__ = ()
 
     def plot_light_curves(self, axis, cm, zorder, label=None, plot_spline=False, offset=0, linestyle='-'):
         """ Plots the light curve with error bars and a different color for each"""
-        data = self.data
 
         # if label is None:
         #     label = os.path.basename(self.filename).split('_')[0]
 
-        if not data['Phase(T_Bmax)'].empty and axis is not None:
-            axis.errorbar(data['Phase(T_Bmax)'], data['Abs mag']+offset, yerr=data['Error Abs mag'], fmt=cm[1],
+        if len(self.phase) and axis is not None:
+            axis.errorbar(self.phase, self.absMag+offset, yerr=self.absMagErr, fmt=cm[1],
                           label=label, zorder=zorder, color=cm[0], alpha=0.8)
             if plot_spline:
                 xBins, yBins = self.bin_light_curve()
@@ -64,8 +61,8 @@ class LightCurve(object):
             # plt.errorbar(data['Phase(T_Bmax)'], data['App mag'], yerr=data['Error App mag'], fmt='o')
 
     def bin_light_curve(self, fig=None, ax=None, band=None, i=0):
-        phase = self.data['Phase(T_Bmax)'].values
-        absMag = self.data['Abs mag'].values
+        phase = self.phase
+        absMag = self.absMag
         xBins = np.arange(-10, 100, self.bin_size)
         # yBinned = np.interp(x=xBins, xp=phase, fp=absMag, left=np.NaN, right=np.NaN)
         if len(phase) <= 3:
@@ -125,3 +122,100 @@ class LightCurve(object):
             axis.plot(peakPhases, peakMags, 'o', color=cm[0], marker=cm[1], zorder=zorder)
 
         return peakPhases, peakMags
+
+
+class LightCurve(_BaseLightCurve):
+    def __init__(self, filename, bin_size=1, interpKind='slinear'):
+        self.filename = filename
+        self.snVars, self.data = self.get_data()
+        self.header = parse_header(self.snVars)
+        self.bin_size = bin_size
+        self.interpKind = interpKind
+
+    def get_data(self):
+        """
+        Retrieves the header variables and the light curve data from a supernova data file.
+        
+        Returns
+        -------
+        fileVars : dict
+            File variables from the header of the input self.filename
+        data : DataFrame
+            The data for each epoch with data from the input self.filename
+        
+        """
+        fileVars, columnNames = read_header(self.filename)
+
+        data = pd.read_csv(self.filename, header=None, delim_whitespace=True, skiprows=12, names=columnNames,
+                           comment='#')
+
+        return fileVars, data
+
+    @property
+    def phase(self):
+        return self.data['Phase(T_Bmax)'].values
+
+    @property
+    def appMag(self):
+        return self.data['App mag'].values
+
+    @property
+    def absMag(self):
+        return self.data['Abs mag'].values
+
+    @absMag.setter
+    def absMag(self, absMag):
+        self.data['Abs mag'] = absMag
+
+    @property
+    def absMagErr(self):
+        return self.data['Error Abs mag'].values
+
+
+class CompactLightCurve(_BaseLightCurve):
+    """ Light curve holding only the typed header and the columns needed for population work as contiguous arrays.
+    The string header values and the full pandas DataFrame are only read from the file if the snVars or data
+    attributes are used. """
+    __slots__ = ('filename', 'header', 'bin_size', 'interpKind', 'phase', 'appMag', '_absMag', 'absMagErr',
+                 '_snVars', '_data')
+
+    columns = {'phase': 'Phase(T_Bmax)', 'appMag': 'App mag', '_absMag': 'Abs mag', 'absMagErr': 'Error Abs mag'}
+
+    def __init__(self, filename, bin_size=1, interpKind='slinear', dtype='float64'):
+        self.filename = filename
+        self.bin_size = bin_size
+        self.interpKind = interpKind
+        self._snVars, self._data = None, None
+        snVars, columnNames = read_header(filename)
+        self.header = parse_header(snVars)
+
+        data = pd.read_csv(filename, header=None, delim_whitespace=True, skiprows=12, names=columnNames,
+                           comment='#', usecols=list(self.columns.values()))
+        for attribute, column in self.columns.items():
+            setattr(self, attribute, np.ascontiguousarray(data[column].values, dtype=dtype))
+
+    @property
+    def absMag(self):
+        return self._absMag
+
+    @absMag.setter
+    def absMag(self, absMag):
+        self._absMag = np.ascontiguousarray(absMag, dtype=self._absMag.dtype)
+        self._data = None
+
+    @property
+    def snVars(self):
+        """ String header values of the file, as in LightCurve.snVars. Created on first use. """
+        if self._snVars is None:
+            self._snVars = read_header(self.filename)[0]
+        return self._snVars
+
+    @property
+    def data(self):
+        """ DataFrame of every column in the file, with the arrays held by this object in place of the
+        corresponding columns. Created on first use. Edits to it are not copied back to the arrays. """
+        if self._data is None:
+            self._data = LightCurve.get_data(self)[1]
+            for attribute, column in self.columns.items():
+                self._data[column] = getattr(self, attribute)
+        return self._data
@@ -1,9 +1,16 @@
 import os
+from multiprocessing import Pool
 
 
-def get_filenames(band):
+def get_band_directory(band):
     scriptDir = os.path.dirname(os.path.realpath(__file__))
     directory = os.path.join(scriptDir, '../data/NIR_Lowz_data', "{}_band".format(band))
+
+    return directory, scriptDir
+
+
+def get_filenames(band):
+    directory, scriptDir = get_band_directory(band)
     filenameList = os.listdir(directory)
     filePathList = [os.path.join(directory, f) for f in filenameList]
 
@@ -19,3 +26,15 @@ def get_colors_and_markers():
         for color in colors:
             colorMarker.append((color, marker))
     return colorMarker
+
+
+def map_in_processes(function, argsList, processes=1):
+    """ Apply function to each item of argsList, spread over a pool of 'processes' processes if more than one. """
+    if processes > 1:
+        pool = Pool(processes)
+        try:
+            return pool.map(function, argsList)
+        finally:
+            pool.close()
+            pool.join()
+    return [function(args) for args in argsList]
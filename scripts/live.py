@@ -0,0 +1,284 @@
+""" Long running service that watches the band directories for new or updated photometry files and keeps the
+population light curve and the peak catalogue of each band up to date. Both are rewritten as csv files in
+Figures/live after every update.
+
+Run with: python -m scripts.live
+"""
+import asyncio
+import os
+import re
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from scripts.fit_light_curve import CompactLightCurve
+from scripts.helpers import get_band_directory
+from scripts.population_statistics import get_maximum_label
+
+
+# Data files are named <snName>_<band>..., e.g. SN2005el_Y_band.dat. Hidden files and editor or partly copied
+# temporary files are ignored.
+DATA_FILE_PATTERN = r'^[^._][^_]*_{band}(?:[_.].*)?(?<!\.tmp)(?<!\.swp)(?<!\.part)(?<!~)$'
+
+
+def process_file(filename, bin_size=1, interp_kind='cubic'):
+    """ Parse, bin, find the peaks of and label the maxima of one light curve file.
+
+    Returns
+    -------
+    snName : str
+    xBins, yBins : 1D numpy arrays
+        Binned light curve. None if there are too few epochs to bin.
+    labelledMaxima : dict
+        Phase and Mag of the first, second and other maxima, as in PopulationStatistics.plot_mu_vs_peaks.
+    """
+    snName = os.path.basename(filename).split('_')[0]
+    lightCurve = CompactLightCurve(filename, bin_size=bin_size, interpKind=interp_kind)
+    xBins, yBins = lightCurve.bin_light_curve()
+    peakPhases, peakMags = lightCurve.get_peaks()
+    if peakPhases is None:
+        return snName, None, None, {}
+
+    labelledMaxima = {}
+    for peakPhase, peakMag in zip(peakPhases, peakMags):
+        maximum = get_maximum_label(peakPhase)
+        labelledMaxima[maximum + 'MaxPhase'] = peakPhase
+        labelledMaxima[maximum + 'MaxMag'] = peakMag
+
+    return snName, xBins, yBins, labelledMaxima
+
+
+class RunningPopulation(object):
+    """ NaN-aware running sums of the binned light curves of a band, so that the averageLC and errorsLC of
+    PopulationStatistics.get_binned_light_curves can be updated one file at a time. Like get_binned_light_curves,
+    every file is one row of the population, even if several files belong to the same supernova. """
+    def __init__(self):
+        self.xBins = None
+        self.yBins = {}
+        self._reference = None
+        self._sum, self._sumSq, self._count = 0., 0., 0.
+
+    def _add(self, yBins, sign):
+        # Sums are of the offsets from a fixed reference curve, so that errorsLC keeps its precision where the
+        # light curves nearly agree
+        finite = np.isfinite(yBins)
+        if self._reference is None:
+            self._reference = np.where(finite, yBins, np.mean(yBins[finite]) if finite.any() else 0.)
+        values = np.where(finite, yBins - self._reference, 0.)
+        self._sum = self._sum + sign * values
+        self._sumSq = self._sumSq + sign * values ** 2
+        self._count = self._count + sign * finite
+
+    def update(self, filename, xBins, yBins):
+        """ Replace the binned light curve of filename. Set yBins to None to remove the file. """
+        if filename in self.yBins:
+            self._add(self.yBins.pop(filename), -1)
+        if yBins is not None:
+            self.xBins = xBins
+            self.yBins[filename] = yBins
+            self._add(yBins, 1)
+
+    def get_average_light_curve(self):
+        """ Returns the binned phases, averageLC and errorsLC. """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            offset = np.where(self._count > 0, self._sum / self._count, np.nan)
+            variance = np.where(self._count > 0, self._sumSq / self._count - offset ** 2, np.nan)
+        errorsLC = np.sqrt(np.clip(variance, 0, None))
+
+        return self.xBins, self._reference + offset, errorsLC
+
+
+def write_csv(dataFrame, filename):
+    """ Write to a temporary file first so that readers never see a partly written file. """
+    fileDescriptor, tempFilename = tempfile.mkstemp(dir=os.path.dirname(filename), suffix='.tmp')
+    with os.fdopen(fileDescriptor, 'w') as FileObj:
+        dataFrame.to_csv(FileObj)
+    os.replace(tempFilename, filename)
+
+
+class LiveProcessor(object):
+    def __init__(self, bandList, bin_size=1, interp_kind='cubic', pollInterval=5., debounce=10., workers=2,
+                 queueSize=100, outputDir='Figures/live'):
+        """
+        Parameters
+        ----------
+        bandList : list
+            Bands to watch, e.g. ['Y', 'J']. Each band is read from its directory from get_band_directory.
+        pollInterval : float
+            Seconds between scans of the band directories.
+        debounce : float
+            A file is only processed once its size and modification time have not changed for this many seconds.
+        workers : int
+            Number of processes that parse and bin files.
+        queueSize : int
+            Most files waiting to be processed. The watcher waits while the queue is full.
+        outputDir : str
+            Directory that <band>_peak_catalogue.csv and <band>_template.csv are rewritten in after every update.
+        """
+        self.bandList = bandList
+        self.bin_size = bin_size
+        self.interp_kind = interp_kind
+        self.pollInterval = pollInterval
+        self.debounce = debounce
+        self.workers = workers
+        self.queueSize = queueSize
+        self.outputDir = outputDir
+
+        self.directories = {band: get_band_directory(band)[0] for band in bandList}
+        self.populations = {band: RunningPopulation() for band in bandList}
+        self.peaks = {band: {} for band in bandList}
+        self._patterns = {band: re.compile(DATA_FILE_PATTERN.format(band=re.escape(band))) for band in bandList}
+        self._pending = {}
+        self._processed = {}
+        self._failed = {}
+        self._queued = set()
+        self._writeLocks = {}
+
+    def get_peak_catalogue(self, band):
+        """ Labelled maxima of every supernova processed so far, in the format of plot_mu_vs_peaks.
+        If several files belong to one supernova, the file that sorts last is used. """
+        catalogue = {}
+        for filename in sorted(self.peaks[band]):
+            snName, labelledMaxima = self.peaks[band][filename]
+            catalogue[snName] = labelledMaxima
+
+        return pd.DataFrame.from_dict(catalogue).transpose()
+
+    def get_template(self, band):
+        """ Population averageLC and errorsLC of the band, indexed by phase. """
+        xBins, averageLC, errorsLC = self.populations[band].get_average_light_curve()
+
+        return pd.DataFrame({'averageLC': averageLC, 'errorsLC': errorsLC}, index=pd.Index(xBins, name='phase'))
+
+    async def write_outputs(self, band):
+        """ Rewrite the peak catalogue and template files of the band. The writes of each band are serialized,
+        and the tables are built once the lock is held so that a later update is never overwritten by an
+        earlier one. Only the file writes run in a thread. """
+        if band not in self._writeLocks:
+            self._writeLocks[band] = asyncio.Lock()
+        loop = asyncio.get_running_loop()
+        async with self._writeLocks[band]:
+            catalogueFilename = os.path.join(self.outputDir, '{}_peak_catalogue.csv'.format(band))
+            await loop.run_in_executor(None, write_csv, self.get_peak_catalogue(band), catalogueFilename)
+            if self.populations[band].yBins:
+                templateFilename = os.path.join(self.outputDir, '{}_template.csv'.format(band))
+                await loop.run_in_executor(None, write_csv, self.get_template(band), templateFilename)
+
+    def stat_band_directories(self):
+        """ Returns the band and (modification time, size) of every data file in the band directories.
+        A missing directory has no files, and files that are removed while they are scanned are skipped. """
+        signatures = {}
+        for band in self.bandList:
+            try:
+                entries = list(os.scandir(self.directories[band]))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                if not self._patterns[band].match(entry.name):
+                    continue
+                try:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        signatures[entry.path] = (band, (stat.st_mtime, stat.st_size))
+                except FileNotFoundError:
+                    continue
+
+        return signatures
+
+    def scan(self, signatures):
+        """ Compares the file signatures from stat_band_directories with the files seen before.
+
+        Returns
+        -------
+        ready : list
+            (band, filename, signature) of files that have settled since they were last processed. A file that
+            failed to process is only retried once it has changed.
+        removed : list
+            (band, filename) of processed files that no longer exist.
+        """
+        now = time.time()
+        ready = []
+        for filename, (band, signature) in signatures.items():
+            if (filename in self._queued or self._processed.get(filename, (None, None))[1] == signature or
+                    self._failed.get(filename) == signature):
+                continue
+            if self._pending.get(filename, (None,))[0] != signature:
+                self._pending[filename] = (signature, now)
+            elif now - self._pending[filename][1] >= self.debounce:
+                del self._pending[filename]
+                ready.append((band, filename, signature))
+
+        for filename in [f for f in self._pending if f not in signatures]:
+            del self._pending[filename]
+        for filename in [f for f in self._failed if f not in signatures]:
+            del self._failed[filename]
+        removed = [(band, filename) for filename, (band, signature) in self._processed.items()
+                   if filename not in signatures]
+
+        return ready, removed
+
+    def update(self, band, filename, snName, xBins, yBins, labelledMaxima):
+        """ Replace the results of filename. Set yBins to None to remove the file. """
+        self.populations[band].update(filename, xBins, yBins)
+        if yBins is None:
+            self.peaks[band].pop(filename, None)
+        else:
+            self.peaks[band][filename] = (snName, labelledMaxima)
+
+    async def watch(self, queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            signatures = await loop.run_in_executor(None, self.stat_band_directories)
+            ready, removed = self.scan(signatures)
+            for band, filename in removed:
+                del self._processed[filename]
+                self.update(band, filename, None, None, None, None)
+                await self.write_outputs(band)
+                print("{}: removed {}".format(band, filename))
+            for band, filename, signature in ready:
+                self._queued.add(filename)
+                await queue.put((band, filename, signature))
+            await asyncio.sleep(self.pollInterval)
+
+    async def work(self, queue, executor):
+        loop = asyncio.get_running_loop()
+        while True:
+            band, filename, signature = await queue.get()
+            try:
+                snName, xBins, yBins, labelledMaxima = await loop.run_in_executor(
+                    executor, process_file, filename, self.bin_size, self.interp_kind)
+                self.update(band, filename, snName, xBins, yBins, labelledMaxima)
+                self._processed[filename] = (band, signature)
+                self._failed.pop(filename, None)
+                await self.write_outputs(band)
+                print("{}: updated {} {}".format(band, snName, labelledMaxima))
+            except Exception as e:
+                self._failed[filename] = signature
+                print("Failed to process {}: {}".format(filename, e))
+            finally:
+                self._queued.discard(filename)
+                queue.task_done()
+
+    async def run(self):
+        if not os.path.exists(self.outputDir):
+            os.makedirs(self.outputDir)
+        queue = asyncio.Queue(maxsize=self.queueSize)
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            tasks = [asyncio.ensure_future(self.work(queue, executor)) for _ in range(self.workers)]
+            tasks.append(asyncio.ensure_future(self.watch(queue)))
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+
+if __name__ == '__main__':
+    liveProcessor = LiveProcessor(['Y', 'J'])
+    try:
+        asyncio.run(liveProcessor.run())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,62 @@
+import numpy as np
+
+
+# Typed header fields of a supernova data file. Fields missing from a file are NaN (or an empty string).
+HEADER_SCHEMA = [('snName', 'U32'),
+                 ('mu_Snoopy', 'f8'),
+                 ('err_mu_Snoopy', 'f8'),
+                 ('mu_LCDM', 'f8')]
+
+DISTANCE_MODULI = ('mu_Snoopy', 'mu_LCDM')
+
+
+def parse_header(snVars, schema=HEADER_SCHEMA):
+    """ Convert the string header values from LightCurve.get_data into a single typed record of the schema. """
+    header = np.zeros(1, dtype=schema)
+    for name, dtype in schema:
+        value = snVars.get(name)
+        if value is None:
+            header[name] = '' if np.dtype(dtype).kind == 'U' else np.nan
+        else:
+            header[name] = value
+
+    return header[0]
+
+
+def absolute_magnitudes(appMag, lengths, mu, kCorrection=0.):
+    """ Absolute magnitudes of a batch of light curves stored back to back in one flat array.
+
+    Parameters
+    ----------
+    appMag : 1D numpy array
+        Apparent magnitudes of every epoch of every light curve, concatenated.
+    lengths : 1D numpy array
+        Number of epochs in each light curve.
+    mu : 1D numpy array
+        Distance modulus of each light curve.
+    kCorrection : float or 1D numpy array
+        K-correction of each epoch (same shape as appMag), or a single value for all of them.
+    """
+    return appMag - np.repeat(mu, lengths) - kCorrection
+
+
+def change_distance_modulus(absMag, lengths, muOld, muNew):
+    """ Move absolute magnitudes computed with distance moduli muOld onto muNew, keeping any other corrections. """
+    return absMag + np.repeat(np.asarray(muOld) - np.asarray(muNew), lengths)
+
+
+def transform_light_curves(lightCurves, distanceModulus='mu_Snoopy', kCorrection=0.):
+    """ Recompute the 'Abs mag' column of each LightCurve (or CompactLightCurve) from its 'App mag' and the chosen
+    distance modulus of its header, in one vectorized pass over the whole batch. """
+    if distanceModulus not in DISTANCE_MODULI:
+        raise ValueError("Invalid distance modulus: {}".format(distanceModulus))
+    if not lightCurves:
+        return
+
+    lengths = np.array([len(lightCurve.phase) for lightCurve in lightCurves])
+    appMag = np.concatenate([lightCurve.appMag for lightCurve in lightCurves])
+    mu = np.array([lightCurve.header[distanceModulus] for lightCurve in lightCurves])
+
+    absMag = absolute_magnitudes(appMag, lengths, mu, kCorrection)
+    for lightCurve, mags in zip(lightCurves, np.split(absMag, np.cumsum(lengths)[:-1])):
+        lightCurve.absMag = mags
@@ -45,6 +45,7 @@ def main():
         popStats = PopulationStatistics(filenameList, band)
         xBinsArray, yBinsArray, peaks, headerData = popStats.get_binned_light_curves(colorMarker=colorMarker, plot=True, bin_size=0.1, fig_spl=fig[0], ax_spl=ax[0], band_spl=band, i_spl=i, interp_kind='cubic')
         muList = popStats.get_mu(headerData)
+        popStats.get_template_fit(xBinsArray, yBinsArray)
         nirPeaks = popStats.plot_mu_vs_peaks(muList, peaks)
 
         opticalNIR = CompareOpticalAndNIR('data/Table_salt_snoopy_fittedParams.txt', nirPeaks, band)
@@ -141,3 +141,5 @@ class CompareOpticalAndNIR(object):
         plt.setp([a.get_xticklabels() for a in fig.axes[:-1]], visible=False)
         fig.savefig("Figures/{}.png".format(savename), bbox_inches='tight')
 
+        return slope, intercept, r_value, p_value, std_err
+
@@ -3,7 +3,7 @@ import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 
-from .fit_light_curve import LightCurve
+from .fit_light_curve import CompactLightCurve
 from .optical_parameters import read_optical_fitted_table, common_optical_nir_sn
 from .helpers import get_filenames
 
@@ -64,7 +64,7 @@ def plot_specific_light_curves(filenameList=(), colorMarker=None, bin_size=1, ba
     for i, filename in enumerate(filenameList):
         snName = os.path.basename(filename).split('_')[0]
 
-        lightCurve = LightCurve(filename, bin_size=bin_size, interpKind='cubic')
+        lightCurve = CompactLightCurve(filename, bin_size=bin_size, interpKind='cubic')
 
         if opticalFlag:
             if individualplots:
@@ -3,13 +3,26 @@ import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 
-from .fit_light_curve import LightCurve
+from .fit_light_curve import CompactLightCurve
+from .magnitudes import HEADER_SCHEMA, DISTANCE_MODULI, change_distance_modulus
+from .template_fit import fit_population
+
+
+def get_maximum_label(peakPhase):
+    """ Label a light curve maximum as the 'first', 'second' or 'other' maximum from its phase. """
+    if -15 < peakPhase < 8:  # First peak
+        return 'first'
+    elif 15 < peakPhase < 40:  # Second peak
+        return 'second'
+    return 'other'
 
 
 class PopulationStatistics(object):
     def __init__(self, filenameList, bandName):
         self.filenameList = filenameList
         self.bandName = bandName
+        self.lightCurves = {}
+        self.binnedHeaders = np.array([], dtype=HEADER_SCHEMA)
 
     def get_binned_light_curves(self, colorMarker=None, plot=True, bin_size=1, fig_spl=None, ax_spl=None, band_spl='', i_spl=0, interp_kind='cubic'):
         """ Get the peaks and header data for each supernova. And plot the binned light curves.
@@ -34,10 +47,12 @@ class PopulationStatistics(object):
             Each column is a 2 x 1 list of the phase and Mag of a peak/maximum of the light curve.
         headerData : pandas DataFrame
             Each row in the DataFrame contains information about each supernova, respectively.
-            The columns contain the values from the header of each supernova data file (from self.filename). 
+            The columns are the typed header fields of HEADER_SCHEMA, parsed from each supernova data file
+            (from self.filename). Other header keys are not included; they are still in CompactLightCurve.snVars.
         """
 
-        xBinsList, yBinsList, peaks, headerData = [], [], {}, {}
+        xBinsList, yBinsList, peaks, headerData, binnedHeaders = [], [], {}, {}, []
+        self.lightCurves = {}
         zorder = 200
 
         if plot is True:
@@ -54,7 +69,7 @@ class PopulationStatistics(object):
         for i, filename in enumerate(self.filenameList):
             snName = os.path.basename(filename).split('_')[0]
             zorder -= 1
-            lightCurve = LightCurve(filename, bin_size=bin_size, interpKind=interp_kind)
+            lightCurve = CompactLightCurve(filename, bin_size=bin_size, interpKind=interp_kind)
             if plot:
                 lightCurve.plot_light_curves(axis=ax[0], cm=colorMarker[i], zorder=zorder)
             try:
@@ -62,17 +77,20 @@ class PopulationStatistics(object):
                 peakPhases, peakMags = lightCurve.get_peaks(axis=ax[1], cm=colorMarker[i], zorder=zorder)
                 if peakPhases is None:
                     continue
-                header = lightCurve.snVars
                 xBinsList.append(xBins)
                 yBinsList.append(yBins)
+                binnedHeaders.append(lightCurve.header)
                 peaks[snName] = {'peakPhases': peakPhases, 'peakMags': peakMags}
-                headerData[snName] = header
+                headerData[snName] = lightCurve.header
+                self.lightCurves[snName] = lightCurve
             except TypeError:
                 pass
         peaks = pd.DataFrame.from_dict(peaks).transpose()
-        headerData = pd.DataFrame.from_dict(headerData).transpose()
+        headerData = pd.DataFrame(np.array(list(headerData.values()), dtype=HEADER_SCHEMA),
+                                  index=list(headerData.keys()))
 
         xBinsArray, yBinsArray = np.array(xBinsList), np.array(yBinsList)
+        self.binnedHeaders = np.array(binnedHeaders, dtype=HEADER_SCHEMA)
         averageLC = np.nanmean(yBinsArray, axis=0)
         errorsLC = np.nanstd(yBinsArray, axis=0)
 
@@ -87,9 +105,29 @@ class PopulationStatistics(object):
 
         return xBinsArray, yBinsArray, peaks, headerData
 
+    def get_template_fit(self, xBinsArray, yBinsArray, processes=1):
+        """ Fit the stretch, phase shift and magnitude offset of each supernova against the average light curve
+        from get_binned_light_curves, using the light curves it loaded. The parameter table is indexed by SN_name,
+        so it can be joined with read_optical_fitted_table, and is also written to Figures/<band>_template_fit.csv.
+        """
+        averageLC = np.nanmean(yBinsArray, axis=0)
+        templateFit = fit_population(list(self.lightCurves.values()), xBinsArray[0], averageLC, processes=processes)
+        templateFit.to_csv("Figures/%s_template_fit.csv" % self.bandName)
+
+        return templateFit
+
+    def change_distance_modulus(self, yBinsArray, muFrom='mu_Snoopy', muTo='mu_LCDM'):
+        """ Move the yBinsArray from get_binned_light_curves from the muFrom distance moduli onto muTo, using the
+        header of each row. The interpolation is linear in the magnitudes, so this is the same as binning light
+        curves recomputed with transform_light_curves, without reading or binning the files again. """
+        if muFrom not in DISTANCE_MODULI or muTo not in DISTANCE_MODULI:
+            raise ValueError("Invalid distance modulus: {} or {}".format(muFrom, muTo))
+        muOld, muNew = self.binnedHeaders[muFrom], self.binnedHeaders[muTo]
+
+        return change_distance_modulus(yBinsArray.ravel(), yBinsArray.shape[1], muOld, muNew).reshape(yBinsArray.shape)
+
     def get_mu(self, headerData):
-        muList = headerData.loc[:, ['mu_Snoopy', 'err_mu_Snoopy', 'mu_LCDM']]
-        muList = muList.apply(pd.to_numeric)
+        muList = headerData.loc[:, ['mu_Snoopy', 'err_mu_Snoopy', 'mu_LCDM']].astype('float')
 
         return muList
 
@@ -103,22 +141,16 @@ class PopulationStatistics(object):
             if row['peakPhases'].any():
                 count = {'first': 0, 'second': 0, 'other': 0}
                 for peakPhase, peakMag in zip(row['peakPhases'], row['peakMags']):
-                    if -15 < peakPhase < 8:  # First peak
+                    maximum = get_maximum_label(peakPhase)
+                    if maximum == 'first':
                         ax[1, 0].errorbar(peakPhase, row['mu_Snoopy'], yerr=row['err_mu_Snoopy'], fmt='o', color='#1f77b4', alpha=0.5)
                         ax[1, 1].errorbar(peakMag,row['mu_Snoopy'], yerr=row['err_mu_Snoopy'], fmt='o', color='#1f77b4', alpha=0.5)
-                        labelledMaxima[snName]['firstMaxPhase'] = peakPhase
-                        labelledMaxima[snName]['firstMaxMag'] = peakMag
-                        count['first'] += 1
-                    elif 15 < peakPhase < 40:  # Second peak
+                    elif maximum == 'second':
                         ax[0, 0].errorbar(peakPhase, row['mu_Snoopy'], yerr=row['err_mu_Snoopy'], fmt='o', color='#1f77b4', alpha=0.5)
                         ax[0, 1].errorbar(peakMag, row['mu_Snoopy'], yerr=row['err_mu_Snoopy'], fmt='o', color='#1f77b4', alpha=0.5)
-                        labelledMaxima[snName]['secondMaxPhase'] = peakPhase
-                        labelledMaxima[snName]['secondMaxMag'] = peakMag
-                        count['second'] += 1
-                    else:
-                        labelledMaxima[snName]['otherMaxPhase'] = peakPhase
-                        labelledMaxima[snName]['otherMaxMag'] = peakMag
-                        count['other'] += 1
+                    labelledMaxima[snName][maximum + 'MaxPhase'] = peakPhase
+                    labelledMaxima[snName][maximum + 'MaxMag'] = peakMag
+                    count[maximum] += 1
 
                 if count['first'] > 1:
                     print("More than one first maximum recorded for {0} in band {1}".format(snName, self.bandName))
@@ -0,0 +1,380 @@
+""" Golden-output regression checks for the light curve pipeline.
+
+A small synthetic population is written to a temporary directory. Its light curves have two maxima at known
+phases and its optical x1 values are a linear function of the second maximum phase. The binned light curves,
+peaks, labelled maxima and trend line statistics are checked against these known values, and pinned to the
+outputs recorded from the current implementation in regression_golden.npz. A larger synthetic population is
+then run through the same stages. Each stage has to finish within a small multiple of its baseline time
+relative to the DataFrame LightCurve path, which is timed on the same files in the same run.
+
+Run with: python -m scripts.regression
+Re-record the golden outputs (only after checking that a change of outputs is intended) with:
+python -m scripts.regression --record
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from scipy import optimize, stats
+
+from scripts.fit_light_curve import LightCurve, CompactLightCurve
+from scripts.population_statistics import PopulationStatistics
+from scripts.optical_parameters import CompareOpticalAndNIR, read_optical_fitted_table, common_optical_nir_sn
+from scripts.live import LiveProcessor, RunningPopulation, process_file
+from scripts.resampling import jackknife_moments
+
+
+BAND = 'Y'
+BIN_SIZE = 0.1
+INTERP_KIND = 'cubic'
+SECOND_MAX_PHASES = np.arange(24., 40., 2.)
+SN_NAMES = ['snsyn{:02d}'.format(i) for i in range(len(SECOND_MAX_PHASES))]
+TIMING_SECOND_MAX_PHASES = np.linspace(24., 38., 200)
+TIMING_SN_NAMES = ['sntim{:03d}'.format(i) for i in range(len(TIMING_SECOND_MAX_PHASES))]
+OBSERVED_PHASES = np.arange(-10., 70.5, 1.)
+MU = 33.
+
+GOLDEN_FILENAME = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'regression_golden.npz')
+LABELLED_MAXIMA_COLUMNS = ['firstMaxPhase', 'firstMaxMag', 'secondMaxPhase', 'secondMaxMag']
+
+# Absolute tolerances against the known values of the synthetic light curves
+PHASE_TOL = 0.25
+MAG_TOL = 0.01
+SLOPE_TOL = 0.3
+INTERCEPT_TOL = 0.5
+R_TOL = 0.01
+
+# Absolute tolerance against the recorded golden outputs
+GOLDEN_TOL = 1e-8
+
+# Baseline time of each stage for the timing population, as a multiple of the time the DataFrame LightCurve
+# path takes to read and find the peaks of the same files, and the factor a stage may be slower than that by
+TIME_RATIOS = {'read_compact_light_curves': 0.7, 'bin_light_curve': 0.17, 'get_peaks': 0.25,
+               'get_binned_light_curves': 1.4, 'plot_mu_vs_peaks': 7., 'common_optical_nir_sn': 0.01,
+               'plot_parameters': 0.45}
+TIME_FACTOR = 3.
+
+
+def synthetic_abs_mag(phase, secondMaxPhase):
+    """ Light curve with a first maximum near phase 0 and a second maximum near secondMaxPhase. """
+    return (-17. + 0.02 * phase - 1.0 * np.exp(-0.5 * (phase / 6.) ** 2) -
+            0.5 * np.exp(-0.5 * ((phase - secondMaxPhase) / 6.) ** 2))
+
+
+def expected_maximum(secondMaxPhase, guess):
+    """ Phase and magnitude of the maximum (magnitude minimum) of synthetic_abs_mag closest to guess. """
+    result = optimize.minimize_scalar(synthetic_abs_mag, bounds=(guess - 5, guess + 5), method='bounded',
+                                      args=(secondMaxPhase,), options={'xatol': 1e-6})
+    return result.x, result.fun
+
+
+def x1_from_second_max(secondMaxPhase):
+    return 0.1 * (secondMaxPhase - 30.)
+
+
+def write_light_curve(filename, snName, secondMaxPhase):
+    absMag = synthetic_abs_mag(OBSERVED_PHASES, secondMaxPhase)
+    with open(filename, 'w') as FileObj:
+        FileObj.write("# {} synthetic\n".format(snName))
+        FileObj.write("{} 0.05 {} # (mu_Snoopy, err_mu_Snoopy, mu_LCDM)\n".format(MU, MU + 0.02))
+        FileObj.write("#\n" * 9)
+        FileObj.write("# Phase(T_Bmax) | App mag | Error App mag | Abs mag | Error Abs mag | Telescope\n")
+        for phase, mag in zip(OBSERVED_PHASES, absMag):
+            FileObj.write("{:.3f} {:.6f} 0.02 {:.6f} 0.03 SYN\n".format(phase, mag + MU, mag))
+
+
+def write_optical_table(filename, snNames, secondMaxPhases):
+    """ Optical table missing the first synthetic SN and with one SN that has no NIR data. """
+    with open(filename, 'w') as FileObj:
+        FileObj.write("SN_name mB mu_Snoopy x0 x1 c\n")
+        for snName, secondMaxPhase in list(zip(snNames, secondMaxPhases))[1:]:
+            FileObj.write("{} 14.0 {} 0.01 {:.4f} 0.0\n".format(snName, MU, x1_from_second_max(secondMaxPhase)))
+        FileObj.write("sn_optical_only 14.0 {} 0.01 0.0 0.0\n".format(MU))
+
+
+def write_population(directory, snNames, secondMaxPhases):
+    filenameList = []
+    for snName, secondMaxPhase in zip(snNames, secondMaxPhases):
+        filename = os.path.join(directory, "{}_{}_synthetic.dat".format(snName, BAND))
+        write_light_curve(filename, snName, secondMaxPhase)
+        filenameList.append(filename)
+    opticalFilename = os.path.join(directory, 'optical_fitted_params.txt')
+    write_optical_table(opticalFilename, snNames, secondMaxPhases)
+
+    return filenameList, opticalFilename
+
+
+@contextmanager
+def timed(name, timings):
+    start = time.time()
+    yield
+    timings[name] = time.time() - start
+
+
+def assert_close(name, actual, expected, atol):
+    actual, expected = np.asarray(actual, dtype='float'), np.asarray(expected, dtype='float')
+    if actual.shape != expected.shape or not np.allclose(actual, expected, rtol=0, atol=atol, equal_nan=True):
+        raise AssertionError("{}: got {}, expected {} (atol={})".format(name, actual, expected, atol))
+
+
+def check_light_curves(filenameList):
+    """ The DataFrame and compact light curves must give identical bins and peaks. """
+    for filename in filenameList:
+        full = LightCurve(filename, bin_size=BIN_SIZE, interpKind=INTERP_KIND)
+        compact = CompactLightCurve(filename, bin_size=BIN_SIZE, interpKind=INTERP_KIND)
+        assert_close('xBins', compact.bin_light_curve()[0], full.bin_light_curve()[0], 0)
+        assert_close('yBins', compact.bin_light_curve()[1], full.bin_light_curve()[1], 0)
+        for compactPeaks, fullPeaks in zip(compact.get_peaks(), full.get_peaks()):
+            assert_close('peaks', compactPeaks, fullPeaks, 0)
+
+
+def check_binned_light_curves(xBinsArray, yBinsArray):
+    xBins = np.arange(-10, 100, BIN_SIZE)
+    assert_close('xBinsArray', xBinsArray, np.tile(xBins, (len(SN_NAMES), 1)), 1e-12)
+
+    covered = (xBins >= OBSERVED_PHASES[0]) & (xBins <= OBSERVED_PHASES[-1])
+    expected = np.full(yBinsArray.shape, np.nan)
+    for i, secondMaxPhase in enumerate(SECOND_MAX_PHASES):
+        expected[i, covered] = synthetic_abs_mag(xBins[covered], secondMaxPhase)
+    assert_close('yBinsArray', yBinsArray, expected, MAG_TOL)
+
+
+def check_peaks(peaks, labelledMaxima):
+    if list(peaks.index) != SN_NAMES or list(labelledMaxima.index) != SN_NAMES:
+        raise AssertionError("Unexpected supernovae in peaks: {}".format(list(peaks.index)))
+
+    for snName, secondMaxPhase in zip(SN_NAMES, SECOND_MAX_PHASES):
+        firstPhase, firstMag = expected_maximum(secondMaxPhase, 0.)
+        secondPhase, secondMag = expected_maximum(secondMaxPhase, secondMaxPhase)
+        assert_close('{} peakPhases'.format(snName), peaks.loc[snName, 'peakPhases'], [firstPhase, secondPhase],
+                     PHASE_TOL)
+        assert_close('{} peakMags'.format(snName), peaks.loc[snName, 'peakMags'], [firstMag, secondMag], MAG_TOL)
+
+        row = labelledMaxima.loc[snName]
+        assert_close('{} firstMaxPhase'.format(snName), row['firstMaxPhase'], firstPhase, PHASE_TOL)
+        assert_close('{} firstMaxMag'.format(snName), row['firstMaxMag'], firstMag, MAG_TOL)
+        assert_close('{} secondMaxPhase'.format(snName), row['secondMaxPhase'], secondPhase, PHASE_TOL)
+        assert_close('{} secondMaxMag'.format(snName), row['secondMaxMag'], secondMag, MAG_TOL)
+
+    if 'otherMaxPhase' in labelledMaxima:
+        raise AssertionError("Unexpected extra maxima: {}".format(labelledMaxima['otherMaxPhase'].dropna()))
+
+
+def check_common_sn(nirPeaks, opticalFilename):
+    nirCommon, opticalCommon = common_optical_nir_sn(nirPeaks, read_optical_fitted_table(opticalFilename), BAND)
+    if list(nirCommon.index) != SN_NAMES[1:] or list(opticalCommon.index) != SN_NAMES[1:]:
+        raise AssertionError("Unexpected common supernovae: {}, {}".format(list(nirCommon.index),
+                                                                           list(opticalCommon.index)))
+
+
+def check_trend_line(regression):
+    secondPhases = [expected_maximum(p, p)[0] for p in SECOND_MAX_PHASES[1:]]
+    expected = stats.linregress(x1_from_second_max(SECOND_MAX_PHASES[1:]), secondPhases)
+    assert_close('slope', regression[0], expected[0], SLOPE_TOL)
+    assert_close('intercept', regression[1], expected[1], INTERCEPT_TOL)
+    assert_close('r_value', regression[2], expected[2], R_TOL)
+
+
+def check_running_population(filenameList, directory):
+    """ The live running averages must match the batch averageLC and errorsLC, including when a supernova has
+    a second file and when a file is removed again. """
+    extraFilename = os.path.join(directory, "{}_{}_second_file.dat".format(SN_NAMES[1], BAND))
+    write_light_curve(extraFilename, SN_NAMES[1], SECOND_MAX_PHASES[1] + 1.)
+
+    runningPopulation = RunningPopulation()
+    for fileList in [filenameList + [extraFilename], filenameList]:
+        yBinsArray = PopulationStatistics(fileList, BAND).get_binned_light_curves(
+            plot=False, bin_size=BIN_SIZE, interp_kind=INTERP_KIND)[1]
+        for filename in fileList:
+            snName, xBins, yBins, labelledMaxima = process_file(filename, BIN_SIZE, INTERP_KIND)
+            runningPopulation.update(filename, xBins, yBins)
+        if extraFilename not in fileList:
+            runningPopulation.update(extraFilename, None, None)
+
+        xBins, averageLC, errorsLC = runningPopulation.get_average_light_curve()
+        with np.errstate(invalid='ignore'):
+            assert_close('running averageLC', averageLC, np.nanmean(yBinsArray, axis=0), GOLDEN_TOL)
+            assert_close('running errorsLC', errorsLC, np.nanstd(yBinsArray, axis=0), GOLDEN_TOL)
+
+
+def check_live_scan(directory):
+    """ The live scanner only picks up data files, treats a missing band directory as empty, and only retries a
+    file that failed to process once it has changed. """
+    liveProcessor = LiveProcessor([BAND], debounce=0.)
+    liveProcessor.directories[BAND] = os.path.join(directory, 'missing')
+    if liveProcessor.stat_band_directories():
+        raise AssertionError("missing band directory is not empty")
+
+    liveProcessor.directories[BAND] = directory
+    name = "{}_{}_scan.dat".format(SN_NAMES[0], BAND)
+    dataFilename = os.path.join(directory, name)
+    for filename in [dataFilename, '.' + name, name + '.tmp', name + '~', 'notes.txt']:
+        with open(os.path.join(directory, filename), 'w') as FileObj:
+            FileObj.write('not a light curve')
+
+    liveProcessor.scan(liveProcessor.stat_band_directories())
+    ready = liveProcessor.scan(liveProcessor.stat_band_directories())[0]
+    if [filename for band, filename, signature in ready] != [dataFilename]:
+        raise AssertionError("scanned files: got {}, expected {}".format(ready, [dataFilename]))
+
+    liveProcessor._failed[dataFilename] = ready[0][2]
+    for attempt in range(2):
+        if liveProcessor.scan(liveProcessor.stat_band_directories())[0]:
+            raise AssertionError("unchanged failed file is retried")
+    with open(dataFilename, 'a') as FileObj:
+        FileObj.write(' changed')
+    liveProcessor.scan(liveProcessor.stat_band_directories())
+    if not liveProcessor.scan(liveProcessor.stat_band_directories())[0]:
+        raise AssertionError("changed failed file is not retried")
+
+
+def check_jackknife(yBinsArray):
+    """ The jackknife error of a mean is the standard error of the mean, including in bins that only some
+    supernovae cover. """
+    data = yBinsArray.copy()
+    for i in range(len(data)):
+        data[i, :100 * i] = np.nan
+    n = np.isfinite(data).sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        expected = np.where(n >= 2, np.nanstd(data, axis=0, ddof=1) / np.sqrt(n), np.nan)
+    assert_close('jackknife errors', jackknife_moments(data)[1], expected, GOLDEN_TOL)
+
+
+def golden_outputs(outputs):
+    """ Arrays of the pipeline outputs that are pinned by the golden file. """
+    xBinsArray, yBinsArray, peaks, labelledMaxima, regression = outputs
+
+    return {'snNames': np.array(peaks.index, dtype='U'),
+            'xBinsArray': xBinsArray,
+            'yBinsArray': yBinsArray,
+            'peakCounts': np.array([len(p) for p in peaks['peakPhases']]),
+            'peakPhases': np.concatenate(list(peaks['peakPhases'])),
+            'peakMags': np.concatenate(list(peaks['peakMags'])),
+            'labelledMaximaColumns': np.array(sorted(labelledMaxima.columns), dtype='U'),
+            'labelledMaxima': labelledMaxima[LABELLED_MAXIMA_COLUMNS].values.astype('float'),
+            'regression': np.array(regression)}
+
+
+def check_golden(outputs):
+    with np.load(GOLDEN_FILENAME) as golden:
+        for name, actual in golden_outputs(outputs).items():
+            if actual.dtype.kind == 'U':
+                if not np.array_equal(actual, golden[name]):
+                    raise AssertionError("{}: got {}, expected {}".format(name, actual, golden[name]))
+            else:
+                assert_close(name, actual, golden[name], GOLDEN_TOL)
+
+
+def run_pipeline(filenameList, opticalFilename, timings):
+    """ Run the binning, peak finding, maxima labelling, optical matching and trend line stages, recording the
+    seconds each stage takes in timings. """
+    with timed('read_compact_light_curves', timings):
+        lightCurves = [CompactLightCurve(filename, bin_size=BIN_SIZE, interpKind=INTERP_KIND)
+                       for filename in filenameList]
+
+    with timed('bin_light_curve', timings):
+        for lightCurve in lightCurves:
+            lightCurve.bin_light_curve()
+
+    with timed('get_peaks', timings):  # get_peaks bins the light curve again itself
+        for lightCurve in lightCurves:
+            lightCurve.get_peaks()
+
+    popStats = PopulationStatistics(filenameList, BAND)
+    with timed('get_binned_light_curves', timings):
+        xBinsArray, yBinsArray, peaks, headerData = popStats.get_binned_light_curves(plot=False, bin_size=BIN_SIZE,
+                                                                                     interp_kind=INTERP_KIND)
+
+    with timed('plot_mu_vs_peaks', timings):
+        labelledMaxima = popStats.plot_mu_vs_peaks(popStats.get_mu(headerData), peaks)
+
+    opticalData = read_optical_fitted_table(opticalFilename)
+    with timed('common_optical_nir_sn', timings):
+        common_optical_nir_sn(labelledMaxima, opticalData, BAND)
+
+    opticalNIR = CompareOpticalAndNIR(opticalFilename, labelledMaxima, BAND)
+    fig, ax = plt.subplots(2)
+    with timed('plot_parameters', timings):
+        regression = opticalNIR.plot_parameters(fig=fig, ax=ax, i=0, band=BAND, label=False,
+                                                figinfo=('x1', 'secondMaxPhase', None, None, None, True))
+    plt.close('all')
+
+    return xBinsArray, yBinsArray, peaks, labelledMaxima, regression
+
+
+def time_reference(filenameList):
+    """ Seconds the DataFrame LightCurve path takes to read every file and find its peaks. Stage timings are
+    compared with this, measured in the same run, so that the limits do not depend on the speed of the machine. """
+    start = time.time()
+    for filename in filenameList:
+        LightCurve(filename, bin_size=BIN_SIZE, interpKind=INTERP_KIND).get_peaks()
+
+    return time.time() - start
+
+
+def check_timings(timings, referenceSeconds):
+    for name, seconds in timings.items():
+        limit = TIME_FACTOR * TIME_RATIOS[name] * referenceSeconds
+        if seconds > limit:
+            raise AssertionError("{} took {:.3f}s, more than the {:.3f}s allowed ({} x {} x the {:.3f}s reference)"
+                                 .format(name, seconds, limit, TIME_FACTOR, TIME_RATIOS[name], referenceSeconds))
+
+
+def run_checks(directory, record=False):
+    filenameList, opticalFilename = write_population(os.path.join(directory, 'golden'), SN_NAMES,
+                                                     SECOND_MAX_PHASES)
+    check_light_curves(filenameList)
+
+    outputs = run_pipeline(filenameList, opticalFilename, {})
+    xBinsArray, yBinsArray, peaks, labelledMaxima, regression = outputs
+    check_binned_light_curves(xBinsArray, yBinsArray)
+    check_peaks(peaks, labelledMaxima)
+    check_common_sn(labelledMaxima, opticalFilename)
+    check_trend_line(regression)
+    if record:
+        np.savez_compressed(GOLDEN_FILENAME, **golden_outputs(outputs))
+    check_golden(outputs)
+    check_jackknife(yBinsArray)
+    check_running_population(filenameList, os.path.join(directory, 'golden'))
+    check_live_scan(os.path.join(directory, 'scan'))
+
+    timings = {}
+    filenameList, opticalFilename = write_population(os.path.join(directory, 'timing'), TIMING_SN_NAMES,
+                                                     TIMING_SECOND_MAX_PHASES)
+    referenceSeconds = time_reference(filenameList)
+    run_pipeline(filenameList, opticalFilename, timings)
+    check_timings(timings, referenceSeconds)
+
+    return timings, referenceSeconds
+
+
+def main(record=False):
+    directory = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    try:
+        os.chdir(directory)
+        os.makedirs('Figures')
+        os.makedirs('golden')
+        os.makedirs('timing')
+        os.makedirs('scan')
+        timings, referenceSeconds = run_checks(directory, record)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory)
+
+    print("reference: {:.3f}s".format(referenceSeconds))
+    for name, seconds in sorted(timings.items()):
+        print("{}: {:.3f}s, {:.3f} x reference (baseline {})".format(name, seconds, seconds / referenceSeconds,
+                                                                    TIME_RATIOS[name]))
+    print("All regression checks passed")
+
+
+if __name__ == '__main__':
+    main(record='--record' in sys.argv[1:])
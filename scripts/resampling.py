@@ -0,0 +1,163 @@
+import numpy as np
+import pandas as pd
+
+from .helpers import map_in_processes
+
+
+PEAK_STATISTICS = ['firstMaxPhase', 'firstMaxMag', 'secondMaxPhase', 'secondMaxMag']
+
+
+def _weighted_moments(weights, values, finite):
+    """ Mean and standard deviation of the columns of 'values' for each row of 'weights', ignoring NaNs.
+
+    Each row of weights holds how many times each supernova was drawn, so the whole chunk of resamples
+    reduces to three matrix products instead of a (nResamples x nSN x nBins) array.
+    """
+    counts = weights.dot(finite)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = weights.dot(values) / counts
+        variance = weights.dot(values ** 2) / counts - mean ** 2
+    std = np.sqrt(np.clip(variance, 0, None))
+
+    return mean, std
+
+
+def _bootstrap_chunk(args):
+    values, finite, nResamples, seed = args
+    nSN = values.shape[0]
+    randomState = np.random.RandomState(seed)
+    weights = randomState.multinomial(nSN, np.ones(nSN) / nSN, size=nResamples).astype('float')
+
+    return _weighted_moments(weights, values, finite)
+
+
+def bootstrap_moments(data, nResamples=1000, chunkSize=250, processes=1, seed=None):
+    """ Bootstrap the supernova population (the rows of data) and return the nanmean and nanstd of each column
+    for every resample.
+
+    Parameters
+    ----------
+    data : 2D numpy array
+        Each row is a supernova, e.g. the yBinsArray from PopulationStatistics.get_binned_light_curves.
+    nResamples : int
+        Number of bootstrap resamples.
+    chunkSize : int
+        Number of resamples drawn at once. Memory scales as chunkSize x number of supernovae.
+    processes : int
+        Number of processes to spread the chunks over. Set to 1 to run serially.
+    seed : int
+        Seed for the random number generator. The result does not depend on the number of processes.
+
+    Returns
+    -------
+    means : 2D numpy array
+        nResamples x number of columns array of the resampled means.
+    stds : 2D numpy array
+        nResamples x number of columns array of the resampled standard deviations.
+    """
+    data = np.asarray(data, dtype='float')
+    finite = np.isfinite(data).astype('float')
+    values = np.where(finite, data, 0.)
+
+    chunkSizes = [chunkSize] * (nResamples // chunkSize)
+    if nResamples % chunkSize:
+        chunkSizes.append(nResamples % chunkSize)
+    seeds = np.random.RandomState(seed).randint(2**31 - 1, size=len(chunkSizes))
+    chunks = [(values, finite, n, s) for n, s in zip(chunkSizes, seeds)]
+
+    results = map_in_processes(_bootstrap_chunk, chunks, processes)
+
+    means = np.concatenate([mean for mean, std in results])
+    stds = np.concatenate([std for mean, std in results])
+
+    return means, stds
+
+
+def jackknife_moments(data):
+    """ Leave-one-out nanmean of each column of data, computed in closed form from the column sums.
+
+    Returns
+    -------
+    means : 2D numpy array
+        Row i is the mean of each column with supernova i left out. NaN where supernova i has no value.
+    errors : 1D numpy array
+        Jackknife standard error of the mean of each column, from the supernovae with a value in that column.
+        NaN where fewer than two supernovae have a value.
+    """
+    data = np.asarray(data, dtype='float')
+    finite = np.isfinite(data)
+    values = np.where(finite, data, 0.)
+    n = finite.sum(axis=0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(finite, (values.sum(axis=0) - values) / (n - finite), np.nan)
+        meanOfMeans = np.nanmean(means, axis=0)
+        errors = np.sqrt((n - 1.) / n * np.nansum((means - meanOfMeans) ** 2, axis=0))
+    errors[n < 2] = np.nan
+
+    return means, errors
+
+
+def confidence_interval(samples, level=0.68):
+    """ Lower and upper percentiles of each column of samples enclosing the central 'level' fraction. """
+    lower, upper = np.nanpercentile(samples, [50 * (1 - level), 50 * (1 + level)], axis=0)
+
+    return lower, upper
+
+
+def bootstrap_template(xBinsArray, yBinsArray, nResamples=1000, level=0.68, chunkSize=250, processes=1, seed=None):
+    """ Confidence bands on the average light curve and its scatter (averageLC and errorsLC in
+    PopulationStatistics.get_binned_light_curves) from resampling the binned light curves.
+
+    Returns
+    -------
+    template : pandas DataFrame
+        Indexed by phase. Columns are the averageLC and errorsLC of the full sample, the lower and upper
+        bootstrap confidence limits of each, and the jackknife error on averageLC.
+    """
+    means, stds = bootstrap_moments(yBinsArray, nResamples, chunkSize, processes, seed)
+    averageLower, averageUpper = confidence_interval(means, level)
+    errorsLower, errorsUpper = confidence_interval(stds, level)
+    jackknifeErrors = jackknife_moments(yBinsArray)[1]
+
+    with np.errstate(invalid='ignore'):
+        template = pd.DataFrame({'averageLC': np.nanmean(yBinsArray, axis=0),
+                                 'averageLCLower': averageLower,
+                                 'averageLCUpper': averageUpper,
+                                 'averageLCJackknifeErr': jackknifeErrors,
+                                 'errorsLC': np.nanstd(yBinsArray, axis=0),
+                                 'errorsLCLower': errorsLower,
+                                 'errorsLCUpper': errorsUpper},
+                                index=pd.Index(xBinsArray[0], name='phase'))
+
+    return template
+
+
+def bootstrap_peak_statistics(labelledMaxima, nResamples=1000, level=0.68, chunkSize=250, processes=1, seed=None):
+    """ Confidence intervals on the mean and spread of the first and second maximum phases and magnitudes
+    (the labelledMaxima from PopulationStatistics.plot_mu_vs_peaks).
+
+    Returns
+    -------
+    statistics : pandas DataFrame
+        One row per peak statistic. Columns are the mean and std of the full sample, the lower and upper
+        bootstrap confidence limits of each, and the jackknife error on the mean.
+    """
+    columns = [col for col in PEAK_STATISTICS if col in labelledMaxima]
+    data = labelledMaxima[columns].values.astype('float')
+
+    means, stds = bootstrap_moments(data, nResamples, chunkSize, processes, seed)
+    meanLower, meanUpper = confidence_interval(means, level)
+    stdLower, stdUpper = confidence_interval(stds, level)
+    jackknifeErrors = jackknife_moments(data)[1]
+
+    statistics = pd.DataFrame({'mean': np.nanmean(data, axis=0),
+                               'meanLower': meanLower,
+                               'meanUpper': meanUpper,
+                               'meanJackknifeErr': jackknifeErrors,
+                               'std': np.nanstd(data, axis=0),
+                               'stdLower': stdLower,
+                               'stdUpper': stdUpper},
+                              index=columns)
+
+    return statistics
@@ -0,0 +1,165 @@
+import os
+import numpy as np
+import pandas as pd
+
+from .helpers import map_in_processes
+
+
+PARAMETER_NAMES = ['stretch', 'phaseShift', 'magOffset']
+STRETCH_LIMITS = (0.3, 3.)
+PHASE_SHIFT_LIMITS = (-20., 20.)
+MIN_POINTS = 4
+
+
+def stack_photometry(lightCurves):
+    """ Pad the photometry of each LightCurve (or CompactLightCurve) into (number of SNe x most epochs) arrays.
+    Padding is NaN.
+
+    Returns
+    -------
+    snNames : list
+        Supernova name of each row.
+    phase, mag, err : 2D numpy arrays
+        Phase(T_Bmax), Abs mag and Error Abs mag of each light curve.
+    """
+    snNames = [os.path.basename(lightCurve.filename).split('_')[0] for lightCurve in lightCurves]
+    nPoints = max([len(lightCurve.phase) for lightCurve in lightCurves] + [0])
+    phase, mag, err = (np.full((len(lightCurves), nPoints), np.nan) for _ in range(3))
+    for i, lightCurve in enumerate(lightCurves):
+        n = len(lightCurve.phase)
+        phase[i, :n] = lightCurve.phase
+        mag[i, :n] = lightCurve.absMag
+        err[i, :n] = lightCurve.absMagErr
+
+    return snNames, phase, mag, err
+
+
+def _model(params, phase, templatePhase, templateMag, templateSlope):
+    """ Template stretched and shifted in phase and offset in magnitude, with its derivatives. """
+    stretch, phaseShift, magOffset = (params[:, i:i+1] for i in range(3))
+    u = (phase - phaseShift) / stretch
+    template = np.interp(u, templatePhase, templateMag)
+    slope = np.interp(u, templatePhase, templateSlope, left=0., right=0.)
+
+    model = template + magOffset
+    jacobian = np.stack([-slope * u / stretch, -slope / stretch, np.ones_like(u)], axis=-1)
+
+    return model, jacobian
+
+
+def _chi2(params, phase, mag, weights, templatePhase, templateMag, templateSlope):
+    model = _model(params, phase, templatePhase, templateMag, templateSlope)[0]
+    return np.sum(weights * (mag - model) ** 2, axis=1)
+
+
+def _clip_parameters(params):
+    params[:, 0] = np.clip(params[:, 0], *STRETCH_LIMITS)
+    params[:, 1] = np.clip(params[:, 1], *PHASE_SHIFT_LIMITS)
+    return params
+
+
+def fit_template(phase, mag, err, templatePhase, templateMag, nIterations=50):
+    """ Levenberg-Marquardt fit of the stretch, phase shift and magnitude offset of every light curve at once.
+
+    The model of each light curve is templateMag((phase - phaseShift) / stretch) + magOffset.
+
+    Parameters
+    ----------
+    phase, mag, err : 2D numpy arrays
+        Padded photometry from stack_photometry. One light curve per row.
+    templatePhase, templateMag : 1D numpy arrays
+        Population template, e.g. xBinsArray[0] and the nanmean of yBinsArray.
+    nIterations : int
+        Number of Levenberg-Marquardt iterations.
+
+    Returns
+    -------
+    params : 2D numpy array
+        Best fit stretch, phaseShift and magOffset of each light curve. NaN if there are too few points.
+    errors : 2D numpy array
+        Uncertainties on params from the covariance matrix at the best fit.
+    chi2 : 1D numpy array
+        Chi-squared of the best fit.
+    nPoints : 1D numpy array
+        Number of epochs used in each fit.
+    """
+    templateFinite = np.isfinite(templateMag)
+    templatePhase, templateMag = templatePhase[templateFinite], templateMag[templateFinite]
+    templateSlope = np.gradient(templateMag, templatePhase)
+
+    # Only fit epochs inside the template phase range so that every fit uses a fixed set of points
+    with np.errstate(invalid='ignore', divide='ignore'):
+        usable = (np.isfinite(phase) & np.isfinite(mag) & (err > 0) & (phase >= templatePhase[0]) &
+                  (phase <= templatePhase[-1]))
+        weights = np.where(usable, 1. / err ** 2, 0.)
+    phase, mag = np.where(usable, phase, 0.), np.where(usable, mag, 0.)
+    nPoints = usable.sum(axis=1)
+
+    params = np.zeros((len(phase), 3))
+    params[:, 0] = 1.
+    with np.errstate(invalid='ignore', divide='ignore'):
+        params[:, 2] = (np.sum(weights * (mag - np.interp(phase, templatePhase, templateMag)), axis=1) /
+                        weights.sum(axis=1))
+    params[nPoints < MIN_POINTS, 2] = 0.
+
+    args = (phase, mag, weights, templatePhase, templateMag, templateSlope)
+    chi2 = _chi2(params, *args)
+    damping = np.full(len(phase), 1e-3)
+    for iteration in range(nIterations):
+        model, jacobian = _model(params, phase, templatePhase, templateMag, templateSlope)
+        curvature = np.einsum('npi,np,npj->nij', jacobian, weights, jacobian)
+        gradient = np.einsum('npi,np,np->ni', jacobian, weights, mag - model)
+        diagonal = np.einsum('nii->ni', curvature)
+        dampedCurvature = curvature + (damping[:, np.newaxis] * diagonal + 1e-12)[:, :, np.newaxis] * np.eye(3)
+        step = np.linalg.solve(dampedCurvature, gradient[:, :, np.newaxis])[:, :, 0]
+
+        trial = _clip_parameters(params + step)
+        trialChi2 = _chi2(trial, *args)
+        better = trialChi2 < chi2
+        params[better], chi2[better] = trial[better], trialChi2[better]
+        damping = np.where(better, damping / 10., damping * 10.)
+
+    jacobian = _model(params, phase, templatePhase, templateMag, templateSlope)[1]
+    curvature = np.einsum('npi,np,npj->nij', jacobian, weights, jacobian)
+    errors = np.sqrt(np.abs(np.einsum('nii->ni', np.linalg.pinv(curvature))))
+
+    tooFew = nPoints < MIN_POINTS
+    params[tooFew], errors[tooFew], chi2[tooFew] = np.nan, np.nan, np.nan
+
+    return params, errors, chi2, nPoints
+
+
+def _fit_chunk(args):
+    return fit_template(*args)
+
+
+def fit_population(lightCurves, templatePhase, templateMag, nIterations=50, processes=1, chunkSize=1000):
+    """ Fit every LightCurve against the population template. Chunks of light curves can be spread over a
+    process pool. If several light curves have the same supernova name only the last one is fitted, as in
+    PopulationStatistics.get_binned_light_curves.
+
+    Returns
+    -------
+    fittedParams : pandas DataFrame
+        Indexed by SN_name, like the table from read_optical_fitted_table, so the two can be joined.
+        Columns are the fitted parameters, their errors, the chi-squared and the number of epochs fitted.
+    """
+    lightCurvesBySN = {}
+    for lightCurve in lightCurves:
+        lightCurvesBySN[os.path.basename(lightCurve.filename).split('_')[0]] = lightCurve
+
+    snNames, phase, mag, err = stack_photometry(list(lightCurvesBySN.values()))
+    chunks = [(phase[i:i+chunkSize], mag[i:i+chunkSize], err[i:i+chunkSize], templatePhase, templateMag,
+               nIterations) for i in range(0, max(len(snNames), 1), chunkSize)]
+
+    results = map_in_processes(_fit_chunk, chunks, processes)
+
+    params, errors, chi2, nPoints = (np.concatenate(out) for out in zip(*results))
+
+    fittedParams = pd.DataFrame(params, index=pd.Index(snNames, name='SN_name'), columns=PARAMETER_NAMES)
+    for i, name in enumerate(PARAMETER_NAMES):
+        fittedParams[name + 'Err'] = errors[:, i]
+    fittedParams['chi2'] = chi2
+    fittedParams['nPoints'] = nPoints
+
+    return fittedParams